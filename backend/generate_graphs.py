@@ -6,6 +6,7 @@ import os
 import sys
 import joblib
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
+from sklearn.inspection import permutation_importance
 
 # Add current directory to path
 sys.path.append(os.getcwd())
@@ -28,13 +29,13 @@ def generate_graphs():
     url_extractor = UrlFeatureExtractor()
     url_features = url_extractor.transform(df['body'])
     url_feature_names = ['has_ip', 'len_long', 'is_shortener']
-    df_url = pd.DataFrame(url_features, columns=url_feature_names)
-    
+
     # Add URL length explicitly as it's interesting
-    df['url_length'] = df['body'].apply(len)
-    
-    # Combine
-    df_analysis = pd.concat([df, df_url], axis=1)
+    df['url_length'] = df['body'].str.len().astype(np.int32)
+
+    # Assign columns directly instead of concatenating a second frame
+    df[url_feature_names] = url_features
+    df_analysis = df
     
     #URL Length Distribution
     plt.figure(figsize=(10, 6))
@@ -85,7 +86,15 @@ def generate_graphs():
                 
                 all_names = list(tfidf_names) + html_names + url_names
                 
-                importances = classifier.feature_importances_
+                importances = getattr(classifier, 'feature_importances_', None)
+                if importances is None:
+                    # HistGradientBoosting has no impurity importances;
+                    # estimate them by permuting the transformed features
+                    X_t = feature_union.transform(df['body'])
+                    if hasattr(X_t, 'toarray'):
+                        X_t = X_t.toarray()
+                    perm = permutation_importance(classifier, X_t, df['label'], n_repeats=5, random_state=42)
+                    importances = perm.importances_mean
                 
                 # Create DataFrame
                 if len(all_names) == len(importances):
@@ -2,7 +2,9 @@ import pandas as pd
 import numpy as np
 import joblib
 import os
+import shutil
 import sys
+import tempfile
 import requests
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
@@ -28,10 +30,20 @@ def download_dataset():
     print(f"Downloading dataset from {DATASET_URL}...")
     os.makedirs('backend/data', exist_ok=True)
     try:
-        response = requests.get(DATASET_URL)
-        response.raise_for_status()
-        with open(DATASET_PATH, 'wb') as f:
-            f.write(response.content)
+        # Stream to a temp file in 1 MB chunks (constant memory), then
+        # atomically move into place so a failed download can't leave a
+        # corrupt partial file behind
+        fd, tmp_path = tempfile.mkstemp(dir='backend/data', suffix='.part')
+        try:
+            with requests.get(DATASET_URL, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                with os.fdopen(fd, 'wb') as f:
+                    shutil.copyfileobj(response.raw, f, length=1024 * 1024)
+            os.replace(tmp_path, DATASET_PATH)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
         print("Download complete.")
     except Exception as e:
         print(f"Failed to download dataset: {e}")
@@ -67,13 +79,18 @@ def train_pipeline():
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
     features = FeatureUnion([
-        # Use a custom tokenizer for URLs to capture words like "login", "secure", "account" inside the URL
-        ('url_tfidf', TfidfVectorizer(tokenizer=UrlTokenizer(), token_pattern=None, max_features=500)),
+        # Use a custom tokenizer for URLs to capture words like "login", "secure", "account" inside the URL.
+        # float32 halves the bytes flowing into the classifier; the learned
+        # vocabulary stays because hashed slots collide too much at this size
+        ('url_tfidf', TfidfVectorizer(tokenizer=UrlTokenizer(), token_pattern=None,
+                                      max_features=500, dtype=np.float32)),
         ('html_features', HtmlFeatureExtractor()),        
         ('url_features', UrlFeatureExtractor())           
     ])
     
     # Complete pipeline
+    # The forest stays: histogram gradient boosting predicts faster but
+    # could not be shown to match its held-out accuracy on this dataset
     pipeline = Pipeline([
         ('features', features),
         ('classifier', RandomForestClassifier(n_estimators=100, random_state=42))